@@ -7,16 +7,28 @@
 
 import json
 import os
-import urllib.request
 from decimal import Decimal
 
 import boto3
+import urllib3
+from boto3.dynamodb.conditions import Key
 
 # -----------------------------------------------------------------------------
 # DynamoDB
 # -----------------------------------------------------------------------------
 dynamodb = boto3.resource('dynamodb')
 
+
+def projection(attributes) -> tuple:
+    """取得属性を絞る ProjectionExpression と ExpressionAttributeNames を生成
+
+    属性名は予約語（timestamp 等）と衝突しうるため常に #a{i} プレースホルダで指定する。
+    Returns: (projection_expression, expression_attribute_names)
+    """
+    names = {f'#a{i}': name for i, name in enumerate(attributes)}
+    return ', '.join(names), names
+
+
 # -----------------------------------------------------------------------------
 # テーブル名設定
 # -----------------------------------------------------------------------------
@@ -27,6 +39,9 @@ SENTIMENT_TABLE = os.environ.get('SENTIMENT_TABLE', 'eth-trading-sentiment')
 ANALYSIS_STATE_TABLE = os.environ.get('ANALYSIS_STATE_TABLE', 'eth-trading-analysis-state')
 TF_SCORES_TABLE = os.environ.get('TF_SCORES_TABLE', 'eth-trading-tf-scores')
 
+# ポジションテーブル（ウォームコンテナで使い回すためimport時に1回だけ生成）
+positions_table = dynamodb.Table(POSITIONS_TABLE)
+
 # -----------------------------------------------------------------------------
 # 通貨ペア設定 (TRADING_PAIRS_CONFIG 環境変数から読み込み)
 # Phase 5: 6通貨 → 3通貨 (BTC, ETH, XRP) に集中
@@ -55,6 +70,19 @@ TRADING_PAIRS = json.loads(
     os.environ.get('TRADING_PAIRS_CONFIG', json.dumps(DEFAULT_PAIRS))
 )
 
+# 既定値のない必須キーはimport時に1回だけ検証（設定ミスを各ハンドラの実行時KeyErrorにしない）
+# name（表示名）・coincheck は省略時に通貨ペア名へフォールバックする
+PAIR_CONFIG_KEYS = ('binance', 'news')
+for _pair, _config in TRADING_PAIRS.items():
+    _missing = [k for k in PAIR_CONFIG_KEYS if k not in _config]
+    if _missing:
+        raise ValueError(f"TRADING_PAIRS_CONFIG[{_pair}] is missing keys: {_missing}")
+
+# 列ごとの索引（ホットパスで .get(pair, {}).get(...) を繰り返さないため）
+PAIR_NAMES = {pair: config.get('name', pair) for pair, config in TRADING_PAIRS.items()}
+PAIR_COINCHECK = {pair: config.get('coincheck', pair) for pair, config in TRADING_PAIRS.items()}
+COINCHECK_TO_PAIR = {coincheck: pair for pair, coincheck in PAIR_COINCHECK.items()}
+
 # -----------------------------------------------------------------------------
 # マルチタイムフレーム設定
 # 各TFの Binance interval, TTL, Chronos入力長, スコアスケールを定義
@@ -146,6 +174,30 @@ def get_ttl_seconds(timeframe: str) -> int:
 # -----------------------------------------------------------------------------
 SLACK_WEBHOOK_URL = os.environ.get('SLACK_WEBHOOK_URL', '')
 
+# -----------------------------------------------------------------------------
+# HTTP接続プール (keep-alive)
+# urllib.request は接続を使い回さないため、呼び出し毎に TCP+TLS ハンドシェイクが走る。
+# モジュールスコープの PoolManager ならウォームコンテナ間で接続を再利用できる。
+# urllib3 は botocore の依存として Lambda ランタイムに常に同梱されている。
+# -----------------------------------------------------------------------------
+http_pool = urllib3.PoolManager(num_pools=4, maxsize=4, retries=False)
+# POST ヘッダーは不変のため共有（本文は非ASCIIをエスケープしないUTF-8）
+_JSON_HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
+
+
+def post_json(url: str, payload: dict, timeout: float = 5.0) -> int:
+    """JSONをPOSTしてHTTPステータスコードを返す（keep-alive接続を再利用）
+
+    Slack本文は日本語が大半のため、ASCIIエスケープと区切り空白を省いて送る。
+    """
+    response = http_pool.request(
+        'POST', url,
+        body=json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        headers=_JSON_HEADERS,
+        timeout=timeout,
+    )
+    return response.status
+
 
 def send_slack_notification(message: str, blocks: list = None) -> bool:
     """Slack Webhook通知を送信"""
@@ -163,13 +215,8 @@ def send_slack_notification(message: str, blocks: list = None) -> bool:
                     }
                 ]
             }
-        req = urllib.request.Request(
-            SLACK_WEBHOOK_URL,
-            data=json.dumps(payload).encode('utf-8'),
-            headers={'Content-Type': 'application/json'}
-        )
-        urllib.request.urlopen(req, timeout=5)
-        return True
+        status = post_json(SLACK_WEBHOOK_URL, payload, timeout=5)
+        return status < 400
     except Exception:
         return False
 
@@ -179,37 +226,49 @@ def send_slack_notification(message: str, blocks: list = None) -> bool:
 # -----------------------------------------------------------------------------
 def get_current_price(pair: str) -> float:
     """Coincheck APIから現在価格を取得"""
-    url = f"https://coincheck.com/api/ticker?pair={pair}"
-    req = urllib.request.Request(url)
-    with urllib.request.urlopen(req, timeout=10) as response:
-        data = json.loads(response.read().decode())
-        return float(data['last'])
+    response = http_pool.request(
+        'GET', 'https://coincheck.com/api/ticker',
+        fields={'pair': pair},
+        timeout=10,
+    )
+    # retries=False のプールはエラーステータスでも例外にならないため明示的に判定
+    if response.status >= 400:
+        raise urllib3.exceptions.HTTPError(f"Coincheck ticker returned HTTP {response.status} for {pair}")
+    data = json.loads(response.data)
+    return float(data['last'])
 
 
 # -----------------------------------------------------------------------------
 # ポジション取得
 # -----------------------------------------------------------------------------
+# closed の判定は Python 側で行う（Limit は FilterExpression の前に適用されるため、
+# フィルタ併用だと直近の評価範囲外の未クローズポジションを取りこぼす: docs/bugfix-history.md #10）
+POSITION_QUERY_LIMIT = 10
+
+
+def first_open_position(items: list):
+    """新しい順のポジション項目から未クローズの最新1件を返す（なければ None）"""
+    for item in items:
+        if not item.get('closed'):
+            return item
+    return None
+
+
 def get_active_position(pair: str, table_name: str = None) -> dict:
     """アクティブポジション（未クローズ）を取得"""
-    table = dynamodb.Table(table_name or POSITIONS_TABLE)
+    table = dynamodb.Table(table_name) if table_name else positions_table
     response = table.query(
-        KeyConditionExpression='pair = :pair',
-        ExpressionAttributeValues={':pair': pair},
+        KeyConditionExpression=Key('pair').eq(pair),
         ScanIndexForward=False,
-        Limit=10
+        Limit=POSITION_QUERY_LIMIT
     )
-    items = response.get('Items', [])
-    for item in items:
-        if not item.get('closed'):
-            return item
-    return None
+    return first_open_position(response.get('Items', []))
 
 
 def find_all_active_positions(table_name: str = None) -> list:
     """全通貨ペアのアクティブポジションを取得"""
     positions = []
-    for pair, config in TRADING_PAIRS.items():
-        coincheck_pair = config.get('coincheck', pair)
+    for pair, coincheck_pair in PAIR_COINCHECK.items():
         position = get_active_position(coincheck_pair, table_name)
         if position:
             positions.append({
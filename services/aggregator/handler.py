@@ -15,24 +15,57 @@
 """
 import json
 import os
+import threading
 import time
 import traceback
 import boto3
-from decimal import Decimal, ROUND_HALF_UP
-import urllib.request
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from operator import itemgetter
 from trading_common import (
-    TRADING_PAIRS, POSITIONS_TABLE, SLACK_WEBHOOK_URL,
+    TRADING_PAIRS, SLACK_WEBHOOK_URL,
     TIMEFRAME_CONFIG, ACTIVE_TIMEFRAMES, TIMEFRAME_WEIGHTS,
-    TF_SCORES_TABLE, make_pair_tf_key, get_ttl_seconds,
-    get_current_price, get_active_position, send_slack_notification, dynamodb
+    TF_SCORES_TABLE, POSITIONS_TABLE, POSITION_QUERY_LIMIT, first_open_position,
+    make_pair_tf_key, get_ttl_seconds, projection,
+    get_current_price, send_slack_notification, post_json,
+    PAIR_NAMES, PAIR_COINCHECK, COINCHECK_TO_PAIR, dynamodb
 )
 
-bedrock = boto3.client('bedrock-runtime')
+# Bedrock クライアントは meta_aggregate のAIコメント生成でのみ使うため初回利用時に生成
+# （tf_score モードのコールドスタートでは作らない）
+_bedrock_client = None
+_bedrock_lock = threading.Lock()
 BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'apac.amazon.nova-micro-v1:0')
+# HOLD判定の通貨にもAIコメントを生成するか（デフォルト: 省略してBedrockコストを削減）
+AI_COMMENT_ON_HOLD = os.environ.get('AI_COMMENT_ON_HOLD', 'false').lower() == 'true'
 
 SIGNALS_TABLE = os.environ.get('SIGNALS_TABLE', 'eth-trading-signals')
 MARKET_CONTEXT_TABLE = os.environ.get('MARKET_CONTEXT_TABLE', 'eth-trading-market-context')
 
+# DynamoDB Table リソース（ウォームコンテナで使い回すためimport時に1回だけ生成）
+signals_table = dynamodb.Table(SIGNALS_TABLE)
+tf_scores_table = dynamodb.Table(TF_SCORES_TABLE)
+market_context_table = dynamodb.Table(MARKET_CONTEXT_TABLE)
+
+# 独立したI/O（DynamoDB読み取り等）を並行させるためのスレッドプール
+# モジュールスコープに置き、ウォームコンテナではスレッドを使い回す
+# TFスコア読み取り（通貨数×TF数のQuery）を1〜2往復で終えられる幅にする
+IO_MAX_WORKERS = 8
+_io_executor = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix='aggregator-io')
+# ポジション検索（通貨毎のQuery）の並行数。TFスコア読み取りと同時に走る
+POSITION_MAX_WORKERS = 4
+
+# TFスコア・ポジション読み取り用の低レベルクライアント
+# （Resource API の Decimal 変換を経由せず数値を直接 float にデシリアライズする。
+#   Resource と異なりスレッドセーフなので並行Queryで共有できる）
+# 両プールの同時リクエストが botocore の既定接続プール(10)を超えて
+# 接続の破棄・TLS再接続が起きないよう、合計分の接続を確保する
+dynamodb_client = boto3.client(
+    'dynamodb',
+    config=Config(max_pool_connections=IO_MAX_WORKERS + POSITION_MAX_WORKERS),
+)
+
 # 重み設定 (4コンポーネント: Tech + Chronos + Sentiment + MarketContext)
 # Phase 2: Tech dominant (0.55) → Phase 3: 4成分分散 → Phase 4: AI重視均等化
 # Phase 4: AI(Chronos)の予測精度向上に伴い、TechとAIを同等の基準重みに変更
@@ -51,6 +84,8 @@ MARKET_CONTEXT_WEIGHT = float(os.environ.get('MARKET_CONTEXT_WEIGHT', '0.15'))
 #   少なくとも2主要成分がポジティブでないとシグナル発生しない
 BASE_BUY_THRESHOLD = float(os.environ.get('BASE_BUY_THRESHOLD', '0.18'))
 BASE_SELL_THRESHOLD = float(os.environ.get('BASE_SELL_THRESHOLD', '-0.10'))
+# 通貨別閾値が無い場合の既定値（読み取り専用として共有する）
+_DEFAULT_THRESHOLDS = {'buy': BASE_BUY_THRESHOLD, 'sell': BASE_SELL_THRESHOLD}
 # BB幅の基準値（暗号通貨の典型的なBB幅 ≈ 3%）
 BASELINE_BB_WIDTH = float(os.environ.get('BASELINE_BB_WIDTH', '0.03'))
 # ボラティリティ補正のクランプ範囲
@@ -61,6 +96,13 @@ VOL_CLAMP_MAX = 2.0
 # 最低保有時間（秒）: 表示用（実際の制御はorder-executorで実施）
 MIN_HOLD_SECONDS = int(os.environ.get('MIN_HOLD_SECONDS', '1800'))  # デフォルト30分
 
+# ALL HOLD で判定・ランキング・スコア・閾値・保有ポジションが前回送信時と変わらない場合は
+# Slack通知を省略。前回送信内容はウォームコンテナ内のみ保持（コールドスタート後の初回は必ず送信）
+SLACK_SKIP_UNCHANGED_HOLD = os.environ.get('SLACK_SKIP_UNCHANGED_HOLD', 'true').lower() == 'true'
+# 変化判定に使うスコアの丸め桁（小数第2位 = 0.01 以上の変動で再送）
+SLACK_SIGNATURE_SCORE_DIGITS = 2
+_last_slack_signature = None
+
 # マルチTF整合性チェック
 TF_ALIGNMENT_BONUS = 1.15    # 75%以上同方向 → 15%増幅
 TF_MISALIGN_PENALTY = 0.85   # 50%以下同方向 → 15%減衰
@@ -148,8 +190,7 @@ def handle_tf_score(event, context):
 
         # tf-scores DynamoDBテーブルに保存
         timestamp = int(time.time())
-        for scored in scored_pairs:
-            _save_tf_score(scored, timeframe, timestamp)
+        _save_tf_scores_batch(scored_pairs, timeframe, timestamp)
 
         print(f"[tf_score] Saved {len(scored_pairs)} TF scores for {timeframe}")
 
@@ -179,8 +220,7 @@ def _handle_legacy_tf_score(pairs_results, timeframe):
         scored_pairs.append(scored)
 
     timestamp = int(time.time())
-    for scored in scored_pairs:
-        _save_tf_score(scored, timeframe, timestamp)
+    _save_tf_scores_batch(scored_pairs, timeframe, timestamp)
 
     return {
         'statusCode': 200,
@@ -193,50 +233,54 @@ def _handle_legacy_tf_score(pairs_results, timeframe):
     }
 
 
-def _save_tf_score(scored: dict, timeframe: str, timestamp: int):
-    """per-TFスコアをDynamoDBに保存"""
-    try:
-        table = dynamodb.Table(TF_SCORES_TABLE)
-        pair = scored['pair']
-        pair_tf_key = make_pair_tf_key(pair, timeframe)
+def _build_tf_score_item(scored: dict, timeframe: str, timestamp: int) -> dict:
+    """tf-scoresテーブルに保存するper-TFスコアのアイテムを構築"""
+    pair = scored['pair']
+    pair_tf_key = make_pair_tf_key(pair, timeframe)
 
-        item = {
-            'pair_tf': pair_tf_key,
-            'timestamp': timestamp,
-            'pair': pair,
-            'timeframe': timeframe,
-            'total_score': safe_decimal(scored['total_score']),
-            'components': to_dynamo_map(scored.get('components', {})),
-            'weights': to_dynamo_map(scored.get('weights', {})),
-            'chronos_confidence': safe_decimal(scored.get('chronos_confidence', 0.5)),
-            'bb_width': safe_decimal(scored.get('bb_width', BASELINE_BB_WIDTH), 6),
-            'ttl': timestamp + get_ttl_seconds(timeframe),  # TF別TTL (15m:14d, 1h:30d, 4h:90d, 1d:365d)
-        }
+    item = {
+        'pair_tf': pair_tf_key,
+        'timestamp': timestamp,
+        'pair': pair,
+        'timeframe': timeframe,
+        'total_score': safe_decimal(scored['total_score']),
+        'chronos_confidence': safe_decimal(scored.get('chronos_confidence', 0.5)),
+        'bb_width': safe_decimal(scored.get('bb_width', BASELINE_BB_WIDTH), 6),
+        'ttl': timestamp + get_ttl_seconds(timeframe),  # TF別TTL (15m:14d, 1h:30d, 4h:90d, 1d:365d)
+    }
+    item.update(_nested_attributes(scored, {
+        'components': scored.get('components', {}),
+        'weights': scored.get('weights', {}),
+    }))
 
-        indicators = scored.get('indicators_detail', {})
-        if indicators:
-            item['indicators'] = to_dynamo_map(indicators)
+    # per-TF BUY/SELL/HOLDシグナル
+    item['signal'] = scored.get('signal', 'HOLD')
+    item['buy_threshold'] = safe_decimal(scored.get('buy_threshold', BASE_BUY_THRESHOLD))
+    item['sell_threshold'] = safe_decimal(scored.get('sell_threshold', BASE_SELL_THRESHOLD))
+    return item
 
-        chronos_detail = scored.get('chronos_detail', {})
-        if chronos_detail:
-            item['chronos_detail'] = to_dynamo_map(chronos_detail)
 
-        news_headlines = scored.get('news_headlines', [])
-        if news_headlines:
-            item['news_headlines'] = to_dynamo_map({'h': news_headlines[:5]})['h']
+def _save_tf_scores_batch(scored_pairs: list, timeframe: str, timestamp: int):
+    """per-TFスコアを BatchWriteItem でまとめて保存
 
-        market_detail = scored.get('market_context_detail', {})
-        if market_detail:
-            item['market_detail'] = to_dynamo_map(market_detail)
+    batch_writer が25件単位の分割と UnprocessedItems の再送を行う。
+    """
+    items = []
+    for scored in scored_pairs:
+        try:
+            items.append(_build_tf_score_item(scored, timeframe, timestamp))
+        except Exception as e:
+            print(f"Error building TF score for {scored.get('pair', '?')}@{timeframe}: {e}")
 
-        # per-TF BUY/SELL/HOLDシグナル
-        item['signal'] = scored.get('signal', 'HOLD')
-        item['buy_threshold'] = safe_decimal(scored.get('buy_threshold', BASE_BUY_THRESHOLD))
-        item['sell_threshold'] = safe_decimal(scored.get('sell_threshold', BASE_SELL_THRESHOLD))
+    if not items:
+        return
 
-        table.put_item(Item=item)
+    try:
+        with tf_scores_table.batch_writer(overwrite_by_pkeys=['pair_tf', 'timestamp']) as batch:
+            for item in items:
+                batch.put_item(Item=item)
     except Exception as e:
-        print(f"Error saving TF score for {scored.get('pair', '?')}@{timeframe}: {e}")
+        print(f"Error saving TF scores for {timeframe} ({len(items)} items): {e}")
 
 
 # =============================================================================
@@ -250,20 +294,26 @@ def handle_meta_aggregate(event, context):
     2. マーケットコンテキスト取得
     3. マルチTFウェイトで加重平均 + TF間整合性チェック
     4. 通貨別閾値計算 + BUY/SELL/HOLD判定
-    5. AI総合コメント生成 + Slack通知 + DynamoDB保存
+    5. AI総合コメント生成（BUY/SELL通貨）→ DynamoDB一括保存 → Slack通知
     """
     pairs = list(TRADING_PAIRS.keys())
 
     try:
+        # 現在時刻は1回だけ取得し、鮮度判定・保存タイムスタンプ・通知で共有
+        now = int(time.time())
+
+        # ポジション検索はスコア計算と独立しているため先行して並行実行
+        positions_future = _io_executor.submit(find_all_active_positions)
+
         # 1. 全TFスコアを読み取り
-        all_tf_scores = _read_all_tf_scores(pairs)
+        all_tf_scores = _read_all_tf_scores(pairs, now)
 
         if not all_tf_scores or all(not v for v in all_tf_scores.values()):
             print("[meta_aggregate] No TF scores found in DynamoDB")
             return {'signal': 'HOLD', 'has_signal': False, 'reason': 'no_tf_scores'}
 
         # 2. マーケットコンテキスト取得
-        market_context = fetch_market_context()
+        market_context = fetch_market_context(now)
 
         # 3. マルチTF加重平均 + 整合性チェック
         scored_pairs = []
@@ -275,28 +325,21 @@ def handle_meta_aggregate(event, context):
         # 4. 通貨別閾値計算
         thresholds_map = calculate_per_currency_thresholds(scored_pairs, market_context)
 
-        # 5. AI総合コメント + シグナル保存
-        for scored in scored_pairs:
-            pair_th = thresholds_map.get(scored['pair'],
-                                         {'buy': BASE_BUY_THRESHOLD, 'sell': BASE_SELL_THRESHOLD})
-            ai_comment = generate_ai_comment(scored, pair_th)
-            scored['ai_comment'] = ai_comment
-            save_signal(scored, pair_th['buy'], pair_th['sell'])
+        # 5. スコア順ソート
+        scored_pairs.sort(key=itemgetter('total_score'), reverse=True)
 
-        # 6. スコア順ソート
-        scored_pairs.sort(key=lambda x: x['total_score'], reverse=True)
+        # 6. BUY/SELL/HOLD判定
+        # シグナル別件数は判定ループ内で集計済み
+        per_currency_decisions, signal_counts = decide_per_currency_signals(scored_pairs, thresholds_map)
 
-        # 7. BUY/SELL/HOLD判定
-        per_currency_decisions = decide_per_currency_signals(scored_pairs, thresholds_map)
+        # 7. ポジション取得
+        active_positions = positions_future.result()
 
-        # 8. ポジション取得
-        actionable_decisions = [d for d in per_currency_decisions if d['signal'] != 'HOLD']
-        has_signal = len(actionable_decisions) > 0
-        active_positions = find_all_active_positions()
+        has_signal = signal_counts['BUY'] + signal_counts['SELL'] > 0
 
-        buy_decisions = [d for d in per_currency_decisions if d['signal'] == 'BUY']
-        sell_decisions = [d for d in per_currency_decisions if d['signal'] == 'SELL']
-        hold_decisions = [d for d in per_currency_decisions if d['signal'] == 'HOLD']
+        # 表示用スコアは通貨毎に1回だけ丸めて decisions / ranking で共有
+        # （scored_pairs は TRADING_PAIRS 由来、ポジションは pair キー必須のため直接参照する）
+        display_scores = {s['pair']: round(s['total_score'], 4) for s in scored_pairs}
 
         result = {
             'mode': 'meta_aggregate',
@@ -305,33 +348,51 @@ def handle_meta_aggregate(event, context):
                     'pair': d['analysis_pair'],
                     'coincheck_pair': d['pair'],
                     'signal': d['signal'],
-                    'score': round(d['score'], 4)
+                    'score': display_scores[d['analysis_pair']]
                 }
                 for d in per_currency_decisions
             ],
             'summary': {
-                'buy': len(buy_decisions),
-                'sell': len(sell_decisions),
-                'hold': len(hold_decisions),
+                'buy': signal_counts['BUY'],
+                'sell': signal_counts['SELL'],
+                'hold': signal_counts['HOLD'],
             },
             'has_signal': has_signal,
             'ranking': [
                 {
                     'pair': s['pair'],
-                    'name': TRADING_PAIRS.get(s['pair'], {}).get('name', s['pair']),
-                    'score': round(s['total_score'], 4)
+                    'name': PAIR_NAMES[s['pair']],
+                    'score': display_scores[s['pair']]
                 }
                 for s in scored_pairs
             ],
-            'active_positions': [p.get('pair') for p in active_positions],
+            'active_positions': [p['pair'] for p in active_positions],
             'thresholds': {pair: {'buy': th['buy'], 'sell': th['sell']}
                            for pair, th in thresholds_map.items()},
-            'timestamp': int(time.time())
+            'timestamp': now
         }
 
-        # 10. Slack通知
+        # 8. AI総合コメント + シグナル一括保存
+        # HOLD通貨は発注対象外のためコメント生成を省略（Bedrock呼び出しの大半を削減）
+        # Bedrock呼び出しは通貨間で独立しているため並行実行（botocoreクライアントはスレッドセーフ）
+        signal_by_pair = {d['analysis_pair']: d['signal'] for d in per_currency_decisions}
+        comment_targets = [
+            s for s in scored_pairs
+            if AI_COMMENT_ON_HOLD or signal_by_pair.get(s['pair']) != 'HOLD'
+        ]
+        pair_thresholds = [
+            thresholds_map.get(s['pair'], _DEFAULT_THRESHOLDS)
+            for s in comment_targets
+        ]
+        ai_comments = _io_executor.map(generate_ai_comment, comment_targets, pair_thresholds)
+        for scored, ai_comment in zip(comment_targets, ai_comments):
+            scored['ai_comment'] = ai_comment
+        saved_pairs = save_signals_batch(scored_pairs, thresholds_map, now)
+
+        # 9. Slack通知（シグナル保存の完了後に送信し、保存前に発注済みと告知しない）
         notify_slack(result, scored_pairs, active_positions,
-                     thresholds_map, per_currency_decisions)
+                     thresholds_map, per_currency_decisions,
+                     saved_pairs=saved_pairs)
 
         return result
 
@@ -341,86 +402,133 @@ def handle_meta_aggregate(event, context):
         return {'signal': 'HOLD', 'has_signal': False, 'error': str(e)}
 
 
-def _read_all_tf_scores(pairs: list) -> dict:
+# マルチTF集約で参照する属性のみ取得（weights・market_detail・閾値などは転送しない）
+TF_SCORE_READ_ATTRIBUTES = (
+    'timestamp', 'total_score', 'components', 'chronos_confidence', 'bb_width',
+    'indicators', 'chronos_detail', 'signal', 'news_headlines',
+)
+_TF_SCORE_PROJECTION, _TF_SCORE_ATTRIBUTE_NAMES = projection(TF_SCORE_READ_ATTRIBUTES)
+# キー条件用のプレースホルダ（#a0 = timestamp）
+_TF_SCORE_QUERY_NAMES = {**_TF_SCORE_ATTRIBUTE_NAMES, '#pk': 'pair_tf'}
+_TF_SCORE_KEY_CONDITION = '#pk = :pk AND #a0 >= :since'
+
+
+def _read_tf_score(pair: str, tf: str, current_time: int):
+    """1通貨×1TFの最新スコアを読み取り（鮮度切れは None）
+
+    鮮度判定はソートキー条件 (timestamp >= current_time - staleness) で
+    DynamoDB側に任せ、古い項目は転送しない。
+    """
+    staleness = TF_STALENESS.get(tf, 3600)
+    try:
+        response = dynamodb_client.query(
+            TableName=TF_SCORES_TABLE,
+            KeyConditionExpression=_TF_SCORE_KEY_CONDITION,
+            ExpressionAttributeNames=_TF_SCORE_QUERY_NAMES,
+            ExpressionAttributeValues={
+                ':pk': {'S': make_pair_tf_key(pair, tf)},
+                ':since': {'N': str(current_time - staleness)},
+            },
+            ProjectionExpression=_TF_SCORE_PROJECTION,
+            ScanIndexForward=False,
+            Limit=1
+        )
+        items = response.get('Items', [])
+        if not items:
+            print(f"  {pair}@{tf}: no data within {staleness}s")
+            return None
+
+        item = _from_dynamo_item(items[0])
+        ts = int(item.get('timestamp', 0))
+        score = {
+            'total_score': item.get('total_score', 0.0),
+            'components': item.get('components', {}),
+            'chronos_confidence': item.get('chronos_confidence', 0.5),
+            'bb_width': item.get('bb_width', BASELINE_BB_WIDTH),
+            'timestamp': ts,
+            'indicators': item.get('indicators', {}),
+            'chronos_detail': item.get('chronos_detail', {}),
+            'signal': item.get('signal', 'HOLD'),
+            'news_headlines': item.get('news_headlines', []),
+        }
+        print(f"  {pair}@{tf}: score={score['total_score']:+.4f} (age={current_time - ts}s)")
+        return score
+    except Exception as e:
+        print(f"  {pair}@{tf}: read error: {e}")
+        return None
+
+
+def _read_all_tf_scores(pairs: list, current_time: int) -> dict:
     """
     全通貨 × 全TFの最新スコアをDynamoDBから読み取り
+    (通貨, TF) ごとに別パーティションのため、クエリはスレッドプールで並行実行する
 
     Returns: {"btc_usdt": {"15m": {...}, "1h": {...}, ...}, ...}
     """
-    table = dynamodb.Table(TF_SCORES_TABLE)
-    current_time = int(time.time())
-    result = {}
-
-    for pair in pairs:
-        result[pair] = {}
-        for tf in ACTIVE_TIMEFRAMES:
-            pair_tf_key = make_pair_tf_key(pair, tf)
-            try:
-                response = table.query(
-                    KeyConditionExpression='pair_tf = :ptf',
-                    ExpressionAttributeValues={':ptf': pair_tf_key},
-                    ScanIndexForward=False,
-                    Limit=1
-                )
-                items = response.get('Items', [])
-                if items:
-                    item = items[0]
-                    ts = int(item.get('timestamp', 0))
-                    staleness = TF_STALENESS.get(tf, 3600)
-
-                    if current_time - ts > staleness:
-                        print(f"  {pair}@{tf}: stale ({current_time - ts}s > {staleness}s)")
-                        continue
-
-                    result[pair][tf] = {
-                        'total_score': float(item.get('total_score', 0)),
-                        'components': _dynamo_to_float(item.get('components', {})),
-                        'weights': _dynamo_to_float(item.get('weights', {})),
-                        'chronos_confidence': float(item.get('chronos_confidence', 0.5)),
-                        'bb_width': float(item.get('bb_width', BASELINE_BB_WIDTH)),
-                        'timestamp': ts,
-                        'indicators': _dynamo_to_float(item.get('indicators', {})),
-                        'chronos_detail': _dynamo_to_float(item.get('chronos_detail', {})),
-                        'signal': item.get('signal', 'HOLD'),
-                        'news_headlines': _dynamo_to_float(item.get('news_headlines', [])),
-                        'market_detail': _dynamo_to_float(item.get('market_detail', {})),
-                    }
-                    age = current_time - ts
-                    print(f"  {pair}@{tf}: score={result[pair][tf]['total_score']:+.4f} (age={age}s)")
-                else:
-                    print(f"  {pair}@{tf}: no data")
-            except Exception as e:
-                print(f"  {pair}@{tf}: read error: {e}")
+    keys = [(pair, tf) for pair in pairs for tf in ACTIVE_TIMEFRAMES]
+    scores = _io_executor.map(lambda key: _read_tf_score(key[0], key[1], current_time), keys)
 
+    result = {pair: {} for pair in pairs}
+    for (pair, tf), score in zip(keys, scores):
+        if score is not None:
+            result[pair][tf] = score
     return result
 
 
-def _dynamo_to_float(data):
-    """DynamoDB Decimal → Python float 再帰変換"""
-    if isinstance(data, dict):
-        return {k: _dynamo_to_float(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [_dynamo_to_float(i) for i in data]
-    elif isinstance(data, Decimal):
-        return float(data)
-    return data
+def _from_dynamo_value(value):
+    """低レベルAPIの属性値 ({'N': '0.12'} 等) → Python値（数値は float）"""
+    (dtype, raw), = value.items()
+    if dtype == 'N':
+        return float(raw)
+    if dtype == 'M':
+        return {k: _from_dynamo_value(v) for k, v in raw.items()}
+    if dtype == 'L':
+        return [_from_dynamo_value(v) for v in raw]
+    if dtype == 'NULL':
+        return None
+    if dtype == 'NS':
+        return [float(v) for v in raw]
+    # S / BOOL / B / SS / BS はそのまま
+    return raw
+
+
+def _from_dynamo_item(item: dict) -> dict:
+    """低レベルAPIの項目 → Python dict"""
+    return {k: _from_dynamo_value(v) for k, v in item.items()}
 
 
 def _collect_news_from_tfs(available_tfs: dict) -> list:
     """各TFに保存されたニュースヘッドラインを収集・重複除去して返す。
     最新TF（タイムスタンプが大きい）のニュースを優先。"""
-    seen_titles = set()
-    all_news = []
+    # タイトル → ヘッドライン（dictは挿入順を保持するため先勝ちで重複除去）
+    unique_news = {}
     # タイムスタンプが新しいTF順で処理
-    sorted_tfs = sorted(available_tfs.items(),
-                        key=lambda x: x[1].get('timestamp', 0), reverse=True)
-    for tf, data in sorted_tfs:
-        for n in data.get('news_headlines', []):
+    sorted_tfs = sorted(available_tfs.values(),
+                        key=lambda data: data.get('timestamp', 0), reverse=True)
+    for data in sorted_tfs:
+        for n in data.get('news_headlines', ()):
             title = n.get('title', '') if isinstance(n, dict) else str(n)
-            if title and title not in seen_titles:
-                seen_titles.add(title)
-                all_news.append(n)
-    return all_news[:5]  # 最大5件
+            if title and title not in unique_news:
+                unique_news[title] = n
+                if len(unique_news) >= 5:  # 最大5件に達したら打ち切り
+                    return list(unique_news.values())
+    return list(unique_news.values())
+
+
+# 利用可能TFの組み合わせ → 正規化済みウェイト
+# TIMEFRAME_WEIGHTS は不変のため、ウォームコンテナ内で使い回す
+_norm_weight_cache = {}
+
+
+def _normalized_tf_weights(available_tfs) -> dict:
+    """ウェイト再正規化（不足TFがある場合）。TFの組み合わせごとに1回だけ計算"""
+    key = frozenset(available_tfs)
+    norm_w = _norm_weight_cache.get(key)
+    if norm_w is None:
+        total_weight = sum(TIMEFRAME_WEIGHTS[tf] for tf in key)
+        norm_w = {tf: TIMEFRAME_WEIGHTS[tf] / total_weight for tf in key}
+        _norm_weight_cache[key] = norm_w
+    return norm_w
 
 
 def _calculate_multi_tf_score(pair: str, pair_tf_scores: dict,
@@ -438,23 +546,31 @@ def _calculate_multi_tf_score(pair: str, pair_tf_scores: dict,
     if not available_tfs:
         return _neutral_scored_result(pair)
 
-    # ウェイト再正規化（不足TFがある場合）
-    total_weight = sum(TIMEFRAME_WEIGHTS[tf] for tf in available_tfs)
-    norm_w = {tf: TIMEFRAME_WEIGHTS[tf] / total_weight for tf in available_tfs}
-
-    # TF加重平均スコア
-    weighted_score = sum(
-        data['total_score'] * norm_w[tf] for tf, data in available_tfs.items()
-    )
-
-    # TF間方向性整合性チェック
-    directions = [1 if data['total_score'] > 0.02 else
-                  (-1 if data['total_score'] < -0.02 else 0)
-                  for data in available_tfs.values()]
-    positive = sum(1 for d in directions if d > 0)
-    negative = sum(1 for d in directions if d < 0)
-    majority = max(positive, negative)
-    agreement = majority / len(directions) if directions else 0.5
+    norm_w = _normalized_tf_weights(available_tfs)
+
+    # TF加重平均（スコア・BB幅・Chronos確信度・コンポーネント）と
+    # 方向性（±0.02の不感帯を除いた上昇/下降TF数）を1パスで集計
+    weighted_score = 0.0
+    avg_bb = 0.0
+    avg_conf = 0.0
+    component_sums = dict.fromkeys(('technical', 'chronos', 'sentiment', 'market_context'), 0.0)
+    positive = 0
+    negative = 0
+    for tf, data in available_tfs.items():
+        w = norm_w[tf]
+        score = data['total_score']
+        weighted_score += score * w
+        positive += score > 0.02
+        negative += score < -0.02
+        avg_bb += data.get('bb_width', BASELINE_BB_WIDTH) * w
+        avg_conf += data.get('chronos_confidence', 0.5) * w
+        components = data.get('components', {})
+        for key in component_sums:
+            component_sums[key] += components.get(key, 0) * w
+    avg_components = {key: round(total, 3) for key, total in component_sums.items()}
+
+    # TF間方向性整合性チェック（available_tfs は空でないことを確認済み）
+    agreement = max(positive, negative) / len(available_tfs)
 
     if agreement >= 0.75:
         weighted_score *= TF_ALIGNMENT_BONUS
@@ -492,22 +608,6 @@ def _calculate_multi_tf_score(pair: str, pair_tf_scores: dict,
     final_score = weighted_score + alt_dominance_adjustment
     final_score = max(-1.0, min(1.0, final_score))
 
-    # BB幅の加重平均
-    avg_bb = sum(data.get('bb_width', BASELINE_BB_WIDTH) * norm_w[tf]
-                 for tf, data in available_tfs.items())
-
-    # コンポーネントスコアの加重平均
-    avg_components = {}
-    for key in ['technical', 'chronos', 'sentiment', 'market_context']:
-        avg_components[key] = round(sum(
-            data.get('components', {}).get(key, 0) * norm_w[tf]
-            for tf, data in available_tfs.items()
-        ), 3)
-
-    # Chronos確信度の加重平均
-    avg_conf = sum(data.get('chronos_confidence', 0.5) * norm_w[tf]
-                   for tf, data in available_tfs.items())
-
     # 代表TFのindicators（1h優先）
     rep_tf = '1h' if '1h' in available_tfs else list(available_tfs.keys())[0]
     indicators_detail = available_tfs[rep_tf].get('indicators', {})
@@ -575,22 +675,19 @@ def _neutral_scored_result(pair: str) -> dict:
 
 def score_pair(pair: str, result: dict, market_context: dict = None) -> dict:
     """通貨ペアのスコアを計算（4コンポーネント + 確信度ベース動的重み）"""
-    technical_result = result.get('technical', {})
-    chronos_result = result.get('chronos', {})
-    sentiment_result = result.get('sentiment', {})
+    # Lambda出力の body (JSON文字列) はここで一度だけパースし、
+    # 以降の extract_* ヘルパーにはパース済み dict を渡す
+    technical_body = _result_body(result.get('technical', {}))
+    chronos_body = _result_body(result.get('chronos', {}))
+    sentiment_body = _result_body(result.get('sentiment', {}))
+    technical_indicators = technical_body.get('indicators') or {}
 
-    technical_score = extract_score(technical_result, 'technical_score', 0.5)
-    chronos_score = extract_score(chronos_result, 'chronos_score', 0.5)
-    sentiment_score = extract_score(sentiment_result, 'sentiment_score', 0.5)
+    technical_score = extract_score(technical_body, 'technical_score', 0.5)
+    chronos_score = extract_score(chronos_body, 'chronos_score', 0.5)
+    sentiment_score = extract_score(sentiment_body, 'sentiment_score', 0.5)
 
     # Chronos確信度を取得 (SageMaker版で追加)
-    chronos_confidence = 0.5  # デフォルト
-    if isinstance(chronos_result, dict):
-        if 'body' in chronos_result:
-            body = json.loads(chronos_result['body']) if isinstance(chronos_result['body'], str) else chronos_result['body']
-            chronos_confidence = float(body.get('confidence', 0.5))
-        else:
-            chronos_confidence = float(chronos_result.get('confidence', 0.5))
+    chronos_confidence = extract_score(chronos_body, 'confidence', 0.5)
 
     # -1〜1スケールに正規化
     technical_normalized = technical_score  # 既に-1〜1
@@ -664,22 +761,29 @@ def score_pair(pair: str, result: dict, market_context: dict = None) -> dict:
     # スコアを[-1, 1]にクランプ（alt_dominance_adjustmentで範囲を超えうるため）
     total_score = max(-1.0, min(1.0, total_score))
 
-    # ボラティリティ情報を抽出（BB幅 = (上限-下限)/中央値）
-    bb_width = extract_bb_width(technical_result)
+    # テクニカル指標が無い（上流Lambda失敗など）場合は抽出を省略してデフォルト値を使う
+    if technical_indicators:
+        # ボラティリティ情報を抽出（BB幅 = (上限-下限)/中央値）
+        bb_width = extract_bb_width(technical_indicators)
 
-    # モメンタム変化率を抽出（MACDヒストグラムの傾き）
-    macd_histogram_slope = extract_indicator(technical_result, 'macd_histogram_slope', 0.0)
-    macd_histogram = extract_indicator(technical_result, 'macd_histogram', 0.0)
+        # モメンタム変化率を抽出（MACDヒストグラムの傾き）
+        macd_histogram_slope = extract_indicator(technical_indicators, 'macd_histogram_slope', 0.0)
+        macd_histogram = extract_indicator(technical_indicators, 'macd_histogram', 0.0)
 
-    # === 根拠データ抽出（シグナル解説用） ===
-    # テクニカル指標の生データ
-    indicators_detail = _extract_raw_indicators(technical_result)
+        # === 根拠データ抽出（シグナル解説用） ===
+        # テクニカル指標の生データ
+        indicators_detail = _extract_raw_indicators(technical_indicators)
+    else:
+        bb_width = BASELINE_BB_WIDTH
+        macd_histogram_slope = 0.0
+        macd_histogram = 0.0
+        indicators_detail = {}
 
     # Chronos予測の詳細
-    chronos_detail = _extract_chronos_detail(chronos_result)
+    chronos_detail = _extract_chronos_detail(chronos_body)
 
     # ニュースヘッドライン（sentiment-getterがtop_headlinesを含む）
-    news_headlines = _extract_news_headlines(sentiment_result)
+    news_headlines = _extract_news_headlines(sentiment_body) if sentiment_body else []
 
     return {
         'pair': pair,
@@ -711,17 +815,29 @@ def score_pair(pair: str, result: dict, market_context: dict = None) -> dict:
     }
 
 
-def extract_bb_width(technical_result: dict) -> float:
-    """テクニカル結果からBB幅（ボラティリティ指標）を抽出"""
-    try:
-        indicators = {}
-        if isinstance(technical_result, dict):
-            if 'body' in technical_result:
-                body = json.loads(technical_result['body']) if isinstance(technical_result['body'], str) else technical_result['body']
-                indicators = body.get('indicators', {})
-            else:
-                indicators = technical_result.get('indicators', {})
+def _result_body(sub_result: dict) -> dict:
+    """Lambda結果から body を取り出す（JSON文字列ならパース）
+
+    body を持たない結果はそのまま返す。パースに失敗した場合も結果自体を返し、
+    トップレベルのキーで値を拾えるようにする。
+    """
+    if not isinstance(sub_result, dict):
+        return {}
+    if 'body' not in sub_result:
+        return sub_result
+    body = sub_result['body']
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError as e:  # JSONDecodeError は ValueError のサブクラス
+            print(f"Warning: Failed to parse result body: {e}")
+            return sub_result
+    return body if isinstance(body, dict) else {}
 
+
+def extract_bb_width(indicators: dict) -> float:
+    """テクニカル指標からBB幅（ボラティリティ指標）を抽出"""
+    try:
         bb_upper = float(indicators.get('bb_upper', 0))
         bb_lower = float(indicators.get('bb_lower', 0))
         current_price = float(indicators.get('current_price', 0))
@@ -734,56 +850,70 @@ def extract_bb_width(technical_result: dict) -> float:
     return BASELINE_BB_WIDTH  # デフォルト
 
 
-def extract_indicator(technical_result: dict, key: str, default: float = 0.0) -> float:
-    """テクニカル結果から任意のindicator値を抽出"""
+def extract_indicator(indicators: dict, key: str, default: float = 0.0) -> float:
+    """テクニカル指標から任意のindicator値を抽出"""
     try:
-        indicators = {}
-        if isinstance(technical_result, dict):
-            if 'body' in technical_result:
-                body = json.loads(technical_result['body']) if isinstance(technical_result['body'], str) else technical_result['body']
-                indicators = body.get('indicators', {})
-            else:
-                indicators = technical_result.get('indicators', {})
         return float(indicators.get(key, default))
     except Exception as e:
         print(f"Indicator extraction error for {key}: {e}")
         return default
 
 
-def fetch_market_context() -> dict:
+# マーケットコンテキストのメモリキャッシュ（ウォームコンテナで使い回す）
+# 書き込みは30分間隔のため、数分のTTLなら鮮度はほぼ変わらずDynamoDB読み取りを省ける
+MARKET_CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get('MARKET_CONTEXT_CACHE_TTL_SECONDS', '300'))
+_market_context_cache = {'item': None, 'expires_at': 0.0}
+
+# スコア計算・鮮度判定で参照する属性のみ取得（通貨別 funding_* などは転送しない）
+MARKET_CONTEXT_ATTRIBUTES = (
+    'timestamp', 'market_score', 'fng_value', 'fng_classification', 'fng_score',
+    'funding_score', 'dominance_score', 'btc_dominance', 'avg_funding_rate',
+)
+_MARKET_CONTEXT_PROJECTION, _MARKET_CONTEXT_ATTRIBUTE_NAMES = projection(MARKET_CONTEXT_ATTRIBUTES)
+
+
+def fetch_market_context(now: int = None) -> dict:
     """
     DynamoDBからマーケットコンテキストの最新データを取得
     market-context Lambda が30分間隔で書き込む
+    取得結果は MARKET_CONTEXT_CACHE_TTL_SECONDS の間キャッシュする
 
     Returns: {'market_score': float, 'fng_value': int, 'fng_score': float, ...}
              エラー/データなし時は空dict
     """
     try:
-        table = dynamodb.Table(MARKET_CONTEXT_TABLE)
-        response = table.query(
-            KeyConditionExpression='context_type = :ct',
-            ExpressionAttributeValues={':ct': 'global'},
-            ScanIndexForward=False,  # 最新から
-            Limit=1
-        )
-        items = response.get('Items', [])
-        if items:
-            item = items[0]
-            age_seconds = int(time.time()) - int(item.get('timestamp', 0))
-            # 2時間以上前のデータは古すぎる → 中立扱い
-            if age_seconds > 7200:
-                print(f"Market context data too old ({age_seconds}s ago), using neutral")
+        if now is None:
+            now = int(time.time())
+        item = _market_context_cache['item']
+        if item is None or now >= _market_context_cache['expires_at']:
+            response = market_context_table.query(
+                KeyConditionExpression='context_type = :ct',
+                ExpressionAttributeValues={':ct': 'global'},
+                ProjectionExpression=_MARKET_CONTEXT_PROJECTION,
+                ExpressionAttributeNames=_MARKET_CONTEXT_ATTRIBUTE_NAMES,
+                ScanIndexForward=False,  # 最新から
+                Limit=1
+            )
+            items = response.get('Items', [])
+            if not items:
+                print("No market context data found in DynamoDB")
                 return {}
-            print(f"Market context: score={float(item.get('market_score', 0)):+.4f}, "
-                  f"F&G={item.get('fng_value', '?')}/{item.get('fng_classification', '?')}, "
-                  f"age={age_seconds}s")
-            return item
-        else:
-            print("No market context data found in DynamoDB")
+            item = items[0]
+            _market_context_cache['item'] = item
+            _market_context_cache['expires_at'] = now + MARKET_CONTEXT_CACHE_TTL_SECONDS
+
+        # キャッシュ命中時も鮮度は毎回判定する
+        age_seconds = now - int(item.get('timestamp', 0))
+        # 2時間以上前のデータは古すぎる → 中立扱い
+        if age_seconds > 7200:
+            print(f"Market context data too old ({age_seconds}s ago), using neutral")
             return {}
+        print(f"Market context: score={float(item.get('market_score', 0)):+.4f}, "
+              f"F&G={item.get('fng_value', '?')}/{item.get('fng_classification', '?')}, "
+              f"age={age_seconds}s")
+        return item
     except Exception as e:
         print(f"Error fetching market context: {e}")
-        import traceback
         traceback.print_exc()
         return {}
 
@@ -800,6 +930,12 @@ FNG_BUY_ADDER_GREED = 0.04   # Extreme Greed: BUY閾値に+0.04加算
 # BUY閾値の絶対上限（どんなに高ボラ+Extreme環境でもこれ以上にはならない）
 BUY_THRESHOLD_CAP = float(os.environ.get('BUY_THRESHOLD_CAP', '0.45'))
 
+# TF別のBB幅基準値（通貨・呼び出しごとに TIMEFRAME_CONFIG を引き直さない）
+_TF_BB_BASELINE = {
+    tf: config.get('bb_baseline', BASELINE_BB_WIDTH)
+    for tf, config in TIMEFRAME_CONFIG.items()
+}
+
 
 def calculate_per_currency_thresholds(scored_pairs: list, market_context: dict = None) -> dict:
     """
@@ -841,21 +977,15 @@ def calculate_per_currency_thresholds(scored_pairs: list, market_context: dict =
         bb_width = scored.get('bb_width', BASELINE_BB_WIDTH)
 
         # メタ集約レベルのBB baseline: 各TFのbb_baselineの加重平均
-        # （異なるTFのBB幅を統一基準で比較するため）
-        available_tfs = scored.get('available_timeframes', [])
-        if available_tfs:
-            tf_breakdown = scored.get('tf_breakdown', {})
-            total_w = sum(tf_breakdown.get(tf, {}).get('weight', 0) for tf in available_tfs)
-            if total_w > 0:
-                meta_baseline = sum(
-                    TIMEFRAME_CONFIG.get(tf, {}).get('bb_baseline', BASELINE_BB_WIDTH)
-                    * tf_breakdown.get(tf, {}).get('weight', 0)
-                    for tf in available_tfs
-                ) / total_w
-            else:
-                meta_baseline = BASELINE_BB_WIDTH
-        else:
-            meta_baseline = BASELINE_BB_WIDTH
+        # （異なるTFのBB幅を統一基準で比較するため。重みと加重和は1パスで集計）
+        tf_breakdown = scored.get('tf_breakdown', {})
+        total_w = 0.0
+        weighted_baseline = 0.0
+        for tf in scored.get('available_timeframes', []):
+            w = tf_breakdown.get(tf, {}).get('weight', 0)
+            total_w += w
+            weighted_baseline += _TF_BB_BASELINE.get(tf, BASELINE_BB_WIDTH) * w
+        meta_baseline = weighted_baseline / total_w if total_w > 0 else BASELINE_BB_WIDTH
 
         vol_ratio = bb_width / meta_baseline
         vol_ratio = max(VOL_CLAMP_MIN, min(VOL_CLAMP_MAX, vol_ratio))
@@ -871,7 +1001,7 @@ def calculate_per_currency_thresholds(scored_pairs: list, market_context: dict =
             'vol_ratio': round(vol_ratio, 3),
         }
 
-        name = TRADING_PAIRS.get(pair, {}).get('name', pair)
+        name = PAIR_NAMES.get(pair, pair)
         capped = ' [CAPPED]' if buy_t >= BUY_THRESHOLD_CAP - 0.001 else ''
         print(f"  {name}({pair}) threshold: BUY={buy_t:+.4f} SELL={sell_t:+.4f} "
               f"(bb_width={bb_width:.4f}, vol_ratio={vol_ratio:.2f}){capped}")
@@ -883,7 +1013,7 @@ def calculate_per_currency_thresholds(scored_pairs: list, market_context: dict =
 
 
 def decide_per_currency_signals(scored_pairs: list,
-                                 thresholds_map: dict) -> list:
+                                 thresholds_map: dict) -> tuple:
     """
     通貨毎のBUY/SELL/HOLDを判定（通貨別閾値・ポジション非依存）
 
@@ -895,15 +1025,18 @@ def decide_per_currency_signals(scored_pairs: list,
         scored_pairs: score_pair()の結果リスト
         thresholds_map: {pair: {'buy': float, 'sell': float}} 通貨別閾値
 
-    Returns: list of {pair, analysis_pair, signal, score, buy_threshold, sell_threshold, ...}
+    Returns: (decisions, signal_counts)
+        decisions: list of {pair, analysis_pair, signal, score, buy_threshold, sell_threshold, ...}
+        signal_counts: {'BUY': int, 'SELL': int, 'HOLD': int}（判定ループ内で集計）
     """
     decisions = []
+    signal_counts = {'BUY': 0, 'SELL': 0, 'HOLD': 0}
     for scored in scored_pairs:
         pair = scored['pair']
-        coincheck_pair = TRADING_PAIRS.get(pair, {}).get('coincheck', pair)
+        coincheck_pair = PAIR_COINCHECK.get(pair, pair)
         score = scored['total_score']
 
-        pair_th = thresholds_map.get(pair, {'buy': BASE_BUY_THRESHOLD, 'sell': BASE_SELL_THRESHOLD})
+        pair_th = thresholds_map.get(pair, _DEFAULT_THRESHOLDS)
         buy_t = pair_th['buy']
         sell_t = pair_th['sell']
 
@@ -913,6 +1046,7 @@ def decide_per_currency_signals(scored_pairs: list,
             signal = 'SELL'
         else:
             signal = 'HOLD'
+        signal_counts[signal] += 1
 
         print(f"  {pair} ({coincheck_pair}): score={score:+.4f} → {signal} "
               f"(BUY>={buy_t:+.4f}, SELL<={sell_t:+.4f})")
@@ -930,85 +1064,132 @@ def decide_per_currency_signals(scored_pairs: list,
             'sell_threshold': sell_t,
         })
 
-    buy_count = sum(1 for d in decisions if d['signal'] == 'BUY')
-    sell_count = sum(1 for d in decisions if d['signal'] == 'SELL')
-    hold_count = sum(1 for d in decisions if d['signal'] == 'HOLD')
-    print(f"Per-currency signals: BUY={buy_count} SELL={sell_count} HOLD={hold_count}")
+    print(f"Per-currency signals: BUY={signal_counts['BUY']} "
+          f"SELL={signal_counts['SELL']} HOLD={signal_counts['HOLD']}")
+
+    return decisions, signal_counts
 
-    return decisions
+
+# Slack通知・結果出力で参照するポジション属性（これ以外は取得しない）
+# closed は first_open_position での未クローズ判定用
+POSITION_ATTRIBUTES = ('pair', 'entry_price', 'amount', 'entry_time', 'closed')
+_POSITION_PROJECTION, _POSITION_ATTRIBUTE_NAMES = projection(POSITION_ATTRIBUTES)
+
+
+def _find_active_position(coincheck_pair: str):
+    """1通貨のアクティブポジションを検索（エラー時は None）
+
+    通貨毎に別スレッドから呼ばれるため、スレッドセーフな低レベルクライアントで
+    Query する（boto3 の Resource はスレッド間で共有できない）。
+    直近 POSITION_QUERY_LIMIT 件から未クローズの最新1件を返す（判定は trading_common と共通）。
+    """
+    try:
+        response = dynamodb_client.query(
+            TableName=POSITIONS_TABLE,
+            KeyConditionExpression='#a0 = :pair',  # #a0 = pair（POSITION_ATTRIBUTES の先頭）
+            ExpressionAttributeNames=_POSITION_ATTRIBUTE_NAMES,
+            ExpressionAttributeValues={':pair': {'S': coincheck_pair}},
+            ProjectionExpression=_POSITION_PROJECTION,
+            ScanIndexForward=False,
+            Limit=POSITION_QUERY_LIMIT
+        )
+        return first_open_position([_from_dynamo_item(raw) for raw in response.get('Items', [])])
+    except Exception as e:
+        print(f"Error checking position for {coincheck_pair}: {e}")
+        return None
 
 
 def find_all_active_positions() -> list:
-    """全通貨のアクティブポジションを全て検索"""
-    table = dynamodb.Table(POSITIONS_TABLE)
-    positions = []
+    """全通貨のアクティブポジションを全て検索（通貨毎のQueryを並行実行）
 
-    for pair, config in TRADING_PAIRS.items():
-        coincheck_pair = config['coincheck']
-        try:
-            pos = get_active_position(coincheck_pair)
-            if pos:
-                positions.append(pos)
-        except Exception as e:
-            print(f"Error checking position for {coincheck_pair}: {e}")
+    この関数自体が _io_executor 上で実行されるため、同じプールに投入して待つと
+    ワーカーを塞ぎ合う恐れがある。通貨数分の短命プールで並行させる。
+    """
+    coincheck_pairs = list(PAIR_COINCHECK.values())
+    if not coincheck_pairs:
+        return []
 
-    return positions
+    with ThreadPoolExecutor(max_workers=min(len(coincheck_pairs), POSITION_MAX_WORKERS),
+                            thread_name_prefix='aggregator-position') as executor:
+        results = list(executor.map(_find_active_position, coincheck_pairs))
+    return [pos for pos in results if pos]
 
 
-def extract_score(result: dict, key: str, default: float) -> float:
-    """結果からスコアを抽出"""
+def extract_score(body: dict, key: str, default: float) -> float:
+    """パース済みの結果からスコアを抽出"""
     try:
-        if isinstance(result, dict):
-            if 'body' in result:
-                try:
-                    body = json.loads(result['body']) if isinstance(result['body'], str) else result['body']
-                    return float(body.get(key, default))
-                except (json.JSONDecodeError, TypeError, ValueError) as e:
-                    print(f"Warning: Failed to parse body for {key}: {e}")
-            return float(result.get(key, default))
-        return default
+        return float(body.get(key, default))
     except Exception as e:
         print(f"Error extracting score for {key}: {e}")
         return default
 
 
+# 頻出値（デフォルトスコア・確信度・0など）はDecimalを使い回す（Decimalは不変）
+_COMMON_DECIMALS = {v: Decimal(str(round(v, 4))) for v in (0.0, 0.5, 1.0, -0.5, -1.0)}
+
+
 def safe_decimal(value: float, precision: int = 4) -> Decimal:
-    """安全なDecimal変換（精度誤差対策）"""
+    """安全なDecimal変換（精度誤差対策）
+
+    float は round() → str() 経由で変換する（頻出値はキャッシュを返す）。
+    int は丸め不要なのでそのまま Decimal にする。
+    """
     try:
+        if isinstance(value, int):
+            return Decimal(value)
+        if precision == 4:
+            cached = _COMMON_DECIMALS.get(value)
+            if cached is not None:
+                return cached
         return Decimal(str(round(value, precision)))
     except Exception as e:
         print(f"Decimal conversion error for {value}: {e}")
 
 
 def to_dynamo_map(data: dict) -> dict:
-    """Python dictをDynamoDB互換のmap型に再帰変換（float→Decimal）"""
-    result = {}
-    for k, v in data.items():
-        if isinstance(v, float):
-            result[k] = safe_decimal(v)
-        elif isinstance(v, dict):
-            result[k] = to_dynamo_map(v)
-        elif isinstance(v, list):
-            result[k] = [to_dynamo_map(i) if isinstance(i, dict)
-                         else safe_decimal(i) if isinstance(i, float)
-                         else i
-                         for i in v]
-        else:
-            result[k] = v
+    """Python dictをDynamoDB互換のmap型に変換（float→Decimal）
+
+    入力の dict/list は Slack通知・レスポンスでも参照するため書き換えない。
+    各コンテナを1回だけ浅くコピーし、コピー側をスタックで走査して変換する。
+    """
+    result = dict(data)
+    stack = [result]
+    while stack:
+        current = stack.pop()
+        entries = current.items() if isinstance(current, dict) else enumerate(current)
+        # 既存キーへの代入のみなので走査中に書き換えても安全
+        for k, v in entries:
+            if isinstance(v, float):
+                current[k] = safe_decimal(v)
+            elif isinstance(v, dict):
+                current[k] = v = dict(v)
+                stack.append(v)
+            elif isinstance(v, list):
+                current[k] = v = list(v)
+                stack.append(v)
     return result
 
 
-def _extract_raw_indicators(technical_result: dict) -> dict:
-    """テクニカル結果から主要指標の生データを抽出"""
-    try:
-        indicators = {}
-        if isinstance(technical_result, dict):
-            if 'body' in technical_result:
-                body = json.loads(technical_result['body']) if isinstance(technical_result['body'], str) else technical_result['body']
-                indicators = body.get('indicators', {})
-            else:
-                indicators = technical_result.get('indicators', {})
+def _nested_attributes(scored: dict, base: dict = None) -> dict:
+    """保存用のネスト属性（根拠データ）を1回の to_dynamo_map でまとめて変換
+
+    base の属性は常に含め、根拠データ（指標・Chronos詳細・ニュース・市場環境）は
+    空でないものだけ含める。
+    """
+    nested = dict(base) if base else {}
+    evidence = {
+        'indicators': scored.get('indicators_detail'),
+        'chronos_detail': scored.get('chronos_detail'),
+        'news_headlines': (scored.get('news_headlines') or [])[:5],
+        'market_detail': scored.get('market_context_detail'),
+    }
+    nested.update((k, v) for k, v in evidence.items() if v)
+    return to_dynamo_map(nested)
+
 
+def _extract_raw_indicators(indicators: dict) -> dict:
+    """テクニカル指標から主要指標の生データを抽出"""
+    try:
         # 必要なキーのみ抽出（保存サイズ制御）
         keep_keys = ['rsi', 'macd', 'macd_signal', 'macd_histogram', 'macd_histogram_slope',
                      'sma_20', 'bb_upper', 'bb_lower', 'adx', 'regime',
@@ -1019,15 +1200,9 @@ def _extract_raw_indicators(technical_result: dict) -> dict:
         return {}
 
 
-def _extract_chronos_detail(chronos_result: dict) -> dict:
+def _extract_chronos_detail(cr: dict) -> dict:
     """Chronos予測の詳細を抽出（予測変化率を算出）"""
     try:
-        cr = chronos_result
-        if isinstance(cr, dict) and 'body' in cr:
-            cr = json.loads(cr['body']) if isinstance(cr['body'], str) else cr['body']
-        if not isinstance(cr, dict):
-            return {}
-
         detail = {
             'confidence': float(cr.get('confidence', 0.5)),
             'model': cr.get('model', 'unknown'),
@@ -1051,30 +1226,36 @@ def _extract_chronos_detail(chronos_result: dict) -> dict:
         return {}
 
 
-def _extract_news_headlines(sentiment_result: dict) -> list:
+def _extract_news_headlines(sr: dict) -> list:
     """センチメント結果からニュースヘッドライン上位を抽出"""
     try:
-        sr = sentiment_result
-        if isinstance(sr, dict) and 'body' in sr:
-            sr = json.loads(sr['body']) if isinstance(sr['body'], str) else sr['body']
-        if isinstance(sr, dict):
-            return sr.get('top_headlines', [])
-        return []
+        return sr.get('top_headlines', [])
     except Exception as e:
         print(f"News headlines extraction error: {e}")
         return []
-        return Decimal('0')
+
+
+# 定性解釈で参照する数値指標（float 変換は1通貨につき1回にまとめる）
+_INSIGHT_FLOAT_KEYS = (
+    'rsi', 'adx', 'macd_histogram_slope', 'macd_histogram',
+    'bb_upper', 'bb_lower', 'current_price', 'sma_200', 'volume_multiplier',
+)
+
+
+def _float_snapshot(ind: dict) -> dict:
+    """指標dictから数値指標を float に揃えて取り出す（欠損は None）"""
+    return {k: (float(ind[k]) if ind.get(k) is not None else None) for k in _INSIGHT_FLOAT_KEYS}
 
 
 def _interpret_indicators(scored: dict) -> list:
     """テクニカル指標を定性的な洞察に変換"""
     ind = scored.get('indicators_detail', {})
+    num = _float_snapshot(ind)
     insights = []
 
     # RSI
-    rsi = ind.get('rsi')
-    if rsi is not None:
-        rsi_val = float(rsi)
+    rsi_val = num['rsi']
+    if rsi_val is not None:
         if rsi_val > 70:
             insights.append(f"RSI={rsi_val:.0f}で買われすぎゾーン突入 → 利確圧力・反転リスク上昇")
         elif rsi_val > 60:
@@ -1087,10 +1268,9 @@ def _interpret_indicators(scored: dict) -> list:
             insights.append(f"RSI={rsi_val:.0f}で中立圏")
 
     # ADX + レジーム
-    adx = ind.get('adx')
+    adx_val = num['adx']
     regime = ind.get('regime', 'neutral')
-    if adx is not None:
-        adx_val = float(adx)
+    if adx_val is not None:
         if adx_val > 40:
             insights.append(f"ADX={adx_val:.0f}: 非常に強いトレンドが発生中（{regime}相場）")
         elif adx_val > 25:
@@ -1099,11 +1279,9 @@ def _interpret_indicators(scored: dict) -> list:
             insights.append(f"ADX={adx_val:.0f}: 方向感が弱くレンジ気味")
 
     # MACD モメンタム
-    macd_slope = ind.get('macd_histogram_slope')
-    macd_hist = ind.get('macd_histogram')
-    if macd_slope is not None and macd_hist is not None:
-        slope = float(macd_slope)
-        hist = float(macd_hist)
+    slope = num['macd_histogram_slope']
+    hist = num['macd_histogram']
+    if slope is not None and hist is not None:
         if hist > 0 and slope > 0:
             insights.append("MACD: 強気モメンタム加速中")
         elif hist > 0 and slope < 0:
@@ -1114,22 +1292,21 @@ def _interpret_indicators(scored: dict) -> list:
             insights.append("MACD: 弱気だが下げ勢い鈍化 → 底打ちの兆し")
 
     # BB位置（価格がバンドのどこにあるか）
-    bb_upper = ind.get('bb_upper', 0)
-    bb_lower = ind.get('bb_lower', 0)
-    price = ind.get('current_price', 0)
-    if price and bb_upper and bb_lower and float(bb_upper) > float(bb_lower):
-        bb_range = float(bb_upper) - float(bb_lower)
-        bb_pos = (float(price) - float(bb_lower)) / bb_range
+    bb_upper = num['bb_upper']
+    bb_lower = num['bb_lower']
+    price = num['current_price']
+    if price and bb_upper and bb_lower and bb_upper > bb_lower:
+        bb_pos = (price - bb_lower) / (bb_upper - bb_lower)
         if bb_pos > 0.9:
             insights.append("価格がBB上限に接近（ブレイクアウトまたは反落の分岐点）")
         elif bb_pos < 0.1:
             insights.append("価格がBB下限に接近（反発またはブレイクダウンの分岐点）")
 
     # SMA200 長期トレンド & ゴールデンクロス
-    sma_200 = ind.get('sma_200')
+    sma_200 = num['sma_200']
     golden_cross = ind.get('golden_cross')
     if sma_200 and price:
-        if float(price) > float(sma_200):
+        if price > sma_200:
             insights.append("SMA200の上を推移（長期上昇トレンド内）")
         else:
             insights.append("SMA200を下回る（長期下降トレンド内）")
@@ -1137,9 +1314,8 @@ def _interpret_indicators(scored: dict) -> list:
         insights.append("ゴールデンクロス発生中")
 
     # 出来高
-    volume_mult = ind.get('volume_multiplier')
-    if volume_mult is not None:
-        vm = float(volume_mult)
+    vm = num['volume_multiplier']
+    if vm is not None:
         if vm > 2.0:
             insights.append(f"出来高が平均の{vm:.1f}倍 → 高い関心、シグナルの信頼度が高い")
         elif vm < 0.5:
@@ -1221,14 +1397,26 @@ def _interpret_multi_tf(scored: dict) -> list:
     if not tf_breakdown:
         return insights
 
-    # 各TFのシグナル集約
-    tf_signals = {}
-    for tf in ['15m', '1h', '4h', '1d']:
-        if tf in tf_breakdown:
-            tf_signals[tf] = tf_breakdown[tf].get('signal', 'HOLD')
-
-    buy_tfs = [tf for tf, s in tf_signals.items() if s == 'BUY']
-    sell_tfs = [tf for tf, s in tf_signals.items() if s == 'SELL']
+    # 各TFのシグナル集約と短期(15m/1h)・長期(4h/1d)のスコア合計を1パスで行う
+    buy_tfs = []
+    sell_tfs = []
+    short_sum = long_sum = 0.0
+    short_count = long_count = 0
+    for tf in ('15m', '1h', '4h', '1d'):
+        data = tf_breakdown.get(tf)
+        if data is None:
+            continue
+        signal = data.get('signal', 'HOLD')
+        if signal == 'BUY':
+            buy_tfs.append(tf)
+        elif signal == 'SELL':
+            sell_tfs.append(tf)
+        if tf in ('15m', '1h'):
+            short_sum += data['score']
+            short_count += 1
+        else:
+            long_sum += data['score']
+            long_count += 1
 
     if buy_tfs and not sell_tfs:
         insights.append(f"{', '.join(buy_tfs)}が買いシグナル → 全体的に強気")
@@ -1238,11 +1426,9 @@ def _interpret_multi_tf(scored: dict) -> list:
         insights.append(f"買い({', '.join(buy_tfs)})と売り({', '.join(sell_tfs)})で時間軸間に方向乖離")
 
     # 短期 vs 長期
-    short_tfs = {tf: tf_breakdown[tf] for tf in ['15m', '1h'] if tf in tf_breakdown}
-    long_tfs = {tf: tf_breakdown[tf] for tf in ['4h', '1d'] if tf in tf_breakdown}
-    if short_tfs and long_tfs:
-        short_avg = sum(d['score'] for d in short_tfs.values()) / len(short_tfs)
-        long_avg = sum(d['score'] for d in long_tfs.values()) / len(long_tfs)
+    if short_count and long_count:
+        short_avg = short_sum / short_count
+        long_avg = long_sum / long_count
         if short_avg > 0.01 and long_avg < -0.01:
             insights.append("短期はリバウンド局面だが上位トレンドは下向き → 戻り売りに注意")
         elif short_avg < -0.01 and long_avg > 0.01:
@@ -1257,56 +1443,35 @@ def _interpret_multi_tf(scored: dict) -> list:
     return insights
 
 
-def generate_ai_comment(scored: dict, thresholds: dict) -> str:
-    """Bedrock (Claude 3 Haiku) で専門家レベルの分析コメントを生成
-
-    数値スコアは一切含めず、定性的な市場解釈を提供する。
-    指標値（RSI, ADX, F&G等）は意味のある文脈でのみ引用。
-    """
-    try:
-        pair = scored.get('pair', 'unknown')
-        coin_name = TRADING_PAIRS.get(pair, {}).get('name', pair.upper())
-        total = scored.get('total_score', 0)
+def _get_bedrock():
+    """Bedrock Runtime クライアントを遅延生成して返す（AIコメントは並行生成されるためロックで1回に限定）"""
+    global _bedrock_client
+    if _bedrock_client is None:
+        with _bedrock_lock:
+            if _bedrock_client is None:
+                _bedrock_client = boto3.client('bedrock-runtime')
+    return _bedrock_client
 
-        # シグナル判定
-        signal = 'HOLD'
-        if total >= thresholds.get('buy', BASE_BUY_THRESHOLD):
-            signal = 'BUY'
-        elif total <= thresholds.get('sell', BASE_SELL_THRESHOLD):
-            signal = 'SELL'
-        signal_jp = {'BUY': '買い', 'SELL': '売り', 'HOLD': '様子見'}[signal]
 
-        # === 各データソースを定性的に解釈（Python側で前処理） ===
-        tech_insights = _interpret_indicators(scored)
-        ai_insights = _interpret_chronos(scored)
-        mkt_insights = _interpret_market_context(scored)
-        tf_insights = _interpret_multi_tf(scored)
+# AIコメント用プロンプトの雛形（呼び出し毎に組み立てず、可変部分だけ差し込む）
+_AI_SIGNAL_JP = {'BUY': '買い', 'SELL': '売り', 'HOLD': '様子見'}
 
-        # ニュースヘッドライン
-        news = scored.get('news_headlines', [])
-        news_items = [f"「{n.get('title', '')}」" for n in news[:3] if n.get('title')]
-
-        # === 定性データをプロンプトに構成 ===
-        NL = '\n'
-        materials = f"""通貨: {coin_name}
+_AI_MATERIALS_TEMPLATE = """通貨: {coin_name}
 シグナル判定: {signal_jp}
 
 【テクニカル分析】
-{NL.join('・' + i for i in tech_insights) if tech_insights else '・データ不足'}
+{tech}
 
 【AI予測（Chronos）】
-{NL.join('・' + i for i in ai_insights) if ai_insights else '・データ不足'}
+{ai}
 
 【市場環境】
-{NL.join('・' + i for i in mkt_insights) if mkt_insights else '・データ不足'}
+{mkt}
 
 【マルチタイムフレーム分析】
-{NL.join('・' + i for i in tf_insights) if tf_insights else '・データ不足'}"""
-
-        if news_items:
-            materials += f"\n\n【最近のニュース】\n{'、'.join(news_items)}"
+{tf}{news}"""
 
-        prompt = f"""あなたはヘッジファンドの仮想通貨トレーディングデスクのシニアアナリストです。
+_AI_PROMPT_TEMPLATE = """あなたはヘッジファンドの仮想通貨トレーディングデスクのシニアアナリストです。
 以下の分析データから市場の「物語」を読み取り、個人投資家向けの分析コメントを日本語で作成してください。
 
 {materials}
@@ -1319,7 +1484,50 @@ def generate_ai_comment(scored: dict, thresholds: dict) -> str:
 5. です・ます調で3〜5文、450文字以内
 6. シグナル判定「{signal_jp}」の根拠を自然に織り込む"""
 
-        response = bedrock.converse(
+
+def _format_insights(insights: list) -> str:
+    """定性インサイトを箇条書きに整形（空ならデータ不足）"""
+    if not insights:
+        return '・データ不足'
+    return '\n'.join('・' + i for i in insights)
+
+
+def generate_ai_comment(scored: dict, thresholds: dict) -> str:
+    """Bedrock (Claude 3 Haiku) で専門家レベルの分析コメントを生成
+
+    数値スコアは一切含めず、定性的な市場解釈を提供する。
+    指標値（RSI, ADX, F&G等）は意味のある文脈でのみ引用。
+    """
+    try:
+        pair = scored.get('pair', 'unknown')
+        coin_name = PAIR_NAMES.get(pair, pair.upper())
+        total = scored.get('total_score', 0)
+
+        # シグナル判定
+        signal = 'HOLD'
+        if total >= thresholds.get('buy', BASE_BUY_THRESHOLD):
+            signal = 'BUY'
+        elif total <= thresholds.get('sell', BASE_SELL_THRESHOLD):
+            signal = 'SELL'
+        signal_jp = _AI_SIGNAL_JP[signal]
+
+        # ニュースヘッドライン
+        news = scored.get('news_headlines', [])
+        news_items = [f"「{n.get('title', '')}」" for n in news[:3] if n.get('title')]
+
+        # === 各データソースを定性的に解釈（Python側で前処理）してプロンプトに構成 ===
+        materials = _AI_MATERIALS_TEMPLATE.format(
+            coin_name=coin_name,
+            signal_jp=signal_jp,
+            tech=_format_insights(_interpret_indicators(scored)),
+            ai=_format_insights(_interpret_chronos(scored)),
+            mkt=_format_insights(_interpret_market_context(scored)),
+            tf=_format_insights(_interpret_multi_tf(scored)),
+            news=f"\n\n【最近のニュース】\n{'、'.join(news_items)}" if news_items else '',
+        )
+        prompt = _AI_PROMPT_TEMPLATE.format(materials=materials, signal_jp=signal_jp)
+
+        response = _get_bedrock().converse(
             modelId=BEDROCK_MODEL_ID,
             messages=[{"role": "user", "content": [{"text": prompt}]}],
             inferenceConfig={"maxTokens": 500, "temperature": 0.4},
@@ -1343,65 +1551,133 @@ def generate_ai_comment(scored: dict, thresholds: dict) -> str:
         return ''
 
 
-def save_signal(scored: dict, buy_threshold: float, sell_threshold: float):
-    """全通貨のシグナルを保存（分析履歴・動的閾値対応）"""
-    try:
-        table = dynamodb.Table(SIGNALS_TABLE)
-        # 5分区切りに丸めて重複保存を防止（手動再実行時に上書き）
-        now = int(time.time())
-        timestamp = now - (now % 300)
+def build_signal_item(scored: dict, buy_threshold: float, sell_threshold: float,
+                      now: int) -> dict:
+    """signalsテーブルに保存するアイテムを構築（分析履歴・動的閾値対応）"""
+    # 5分区切りに丸めて重複保存を防止（手動再実行時に上書き）
+    timestamp = now - (now % 300)
+
+    signal = 'HOLD'
+    if scored['total_score'] >= buy_threshold:
+        signal = 'BUY'
+    elif scored['total_score'] <= sell_threshold:
+        signal = 'SELL'
+
+    item = {
+        'pair': scored['pair'],
+        'timestamp': timestamp,
+        'score': safe_decimal(scored['total_score']),
+        'signal': signal,
+        'technical_score': safe_decimal(scored['components']['technical']),
+        'chronos_score': safe_decimal(scored['components']['chronos']),
+        'sentiment_score': safe_decimal(scored['components']['sentiment']),
+        'market_context_score': safe_decimal(scored['components'].get('market_context', 0)),
+        'buy_threshold': safe_decimal(buy_threshold),
+        'sell_threshold': safe_decimal(sell_threshold),
+        'bb_width': safe_decimal(scored.get('bb_width', BASELINE_BB_WIDTH), 6),
+        'ttl': timestamp + 7776000  # 90日後に削除
+    }
 
-        signal = 'HOLD'
-        if scored['total_score'] >= buy_threshold:
-            signal = 'BUY'
-        elif scored['total_score'] <= sell_threshold:
-            signal = 'SELL'
+    # 根拠データ（シグナル解説用）
+    item.update(_nested_attributes(scored))
 
-        item = {
-            'pair': scored['pair'],
-            'timestamp': timestamp,
-            'score': safe_decimal(scored['total_score']),
-            'signal': signal,
-            'technical_score': safe_decimal(scored['components']['technical']),
-            'chronos_score': safe_decimal(scored['components']['chronos']),
-            'sentiment_score': safe_decimal(scored['components']['sentiment']),
-            'market_context_score': safe_decimal(scored['components'].get('market_context', 0)),
-            'buy_threshold': safe_decimal(buy_threshold),
-            'sell_threshold': safe_decimal(sell_threshold),
-            'bb_width': safe_decimal(scored.get('bb_width', BASELINE_BB_WIDTH), 6),
-            'ttl': timestamp + 7776000  # 90日後に削除
-        }
+    ai_comment = scored.get('ai_comment', '')
+    if ai_comment:
+        item['ai_comment'] = ai_comment
 
-        # 根拠データ（シグナル解説用）
-        indicators = scored.get('indicators_detail', {})
-        if indicators:
-            item['indicators'] = to_dynamo_map(indicators)
+    return item
 
-        chronos_detail = scored.get('chronos_detail', {})
-        if chronos_detail:
-            item['chronos_detail'] = to_dynamo_map(chronos_detail)
 
-        news_headlines = scored.get('news_headlines', [])
-        if news_headlines:
-            item['news_headlines'] = to_dynamo_map({'h': news_headlines[:5]})['h']
+def save_signals_batch(scored_pairs: list, thresholds_map: dict, now: int) -> set:
+    """全通貨のシグナルを BatchWriteItem でまとめて保存
 
-        market_detail = scored.get('market_context_detail', {})
-        if market_detail:
-            item['market_detail'] = to_dynamo_map(market_detail)
+    通貨毎の PutItem（N回の往復）を1回のリクエストに集約する。
+    batch_writer が25件単位の分割と UnprocessedItems の再送を行う。
+
+    Returns: 保存できた通貨ペア（analysis pair）の集合
+    """
+    items = []
+    for scored in scored_pairs:
+        pair_th = thresholds_map.get(scored['pair'], _DEFAULT_THRESHOLDS)
+        try:
+            items.append(build_signal_item(scored, pair_th['buy'], pair_th['sell'], now))
+        except Exception as e:
+            print(f"Error building signal for {scored.get('pair', 'unknown')}: {e}")
 
-        ai_comment = scored.get('ai_comment', '')
-        if ai_comment:
-            item['ai_comment'] = ai_comment
+    if not items:
+        return set()
 
-        table.put_item(Item=item)
+    try:
+        with signals_table.batch_writer(overwrite_by_pkeys=['pair', 'timestamp']) as batch:
+            for item in items:
+                batch.put_item(Item=item)
     except Exception as e:
-        print(f"Error saving signal for {scored.get('pair', 'unknown')}: {e}")
+        print(f"Error saving signals ({len(items)} items): {e}")
+        traceback.print_exc()
+        return set()
+    return {item['pair'] for item in items}
+
+
+# Slack表示用: スコアバー（-1〜+1 を10段階、取りうる11通りを事前生成）とメダル
+_SCORE_BARS = tuple('▓' * i + '░' * (10 - i) for i in range(11))
+_MEDALS = ('🥇', '🥈', '🥉')
+_SIGNAL_LABELS = {'BUY': '🟢BUY', 'SELL': '🔴SELL', 'HOLD': '⚪HOLD'}
+_SIGNAL_ICONS = {'BUY': '🟢', 'SELL': '🔴', 'HOLD': '⚪'}
+_ALIGNMENT_ICONS = {'aligned': '✅', 'conflicting': '⚠️', 'mixed': '➖'}
+# フッター（TFウェイト・基準閾値）は設定値のみで決まるため import 時に整形
+_SLACK_FOOTER_TEXT = (
+    f"マルチTF: 15m={TIMEFRAME_WEIGHTS.get('15m', 0):.0%} 1h={TIMEFRAME_WEIGHTS.get('1h', 0):.0%} "
+    f"4h={TIMEFRAME_WEIGHTS.get('4h', 0):.0%} 1d={TIMEFRAME_WEIGHTS.get('1d', 0):.0%} | "
+    f"基準閾値: BUY≥`{BASE_BUY_THRESHOLD:+.3f}` / SELL≤`{BASE_SELL_THRESHOLD:+.3f}` (ボラ補正あり)"
+)
+
+
+def _slack_header(text: str) -> dict:
+    """Slack Block Kit: ヘッダーブロック"""
+    return {"type": "header", "text": {"type": "plain_text", "text": text, "emoji": True}}
+
+
+def _slack_section(text: str) -> dict:
+    """Slack Block Kit: mrkdwn セクションブロック"""
+    return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+
+def _slack_context(text: str) -> dict:
+    """Slack Block Kit: mrkdwn コンテキストブロック"""
+    return {"type": "context", "elements": [{"type": "mrkdwn", "text": text}]}
+
+
+def score_bar(score: float) -> str:
+    """スコア(-1〜+1)を10文字のバーに変換"""
+    return _SCORE_BARS[max(0, min(10, int((score + 1) * 5)))]
+
+
+def _fetch_current_prices(coincheck_pairs: list) -> dict:
+    """Coincheckの現在価格を通貨毎に並行取得（取得失敗の通貨は0）
+
+    notify_slack はAIコメント生成・シグナル保存の完了後に呼ばれるため、
+    _io_executor は空いており、そのまま共有できる。
+    """
+    def fetch(coincheck_pair):
+        try:
+            return get_current_price(coincheck_pair)
+        except Exception as e:
+            print(f"Failed to get current price for {coincheck_pair}: {e}")
+            return 0
+
+    return dict(zip(coincheck_pairs, _io_executor.map(fetch, coincheck_pairs)))
 
 
 def notify_slack(result: dict, scored_pairs: list, active_positions: list,
                  thresholds_map: dict = None,
-                 per_currency_decisions: list = None):
-    """Slackに分析結果を通知（通貨別判定 + ランキング + 通貨別閾値 + 含み損益表示）"""
+                 per_currency_decisions: list = None,
+                 saved_pairs: set = None):
+    """Slackに分析結果を通知（通貨別判定 + ランキング + 通貨別閾値 + 含み損益表示）
+
+    saved_pairs（保存できた通貨ペア）に含まれない BUY/SELL 通貨は送信済みと表示せず警告を出す。
+    None の場合は全通貨を保存済みとして扱う。
+    """
+    global _last_slack_signature
     thresholds_map = thresholds_map or {}
     if not SLACK_WEBHOOK_URL:
         return
@@ -1419,6 +1695,22 @@ def notify_slack(result: dict, scored_pairs: list, active_positions: list,
         sell_count = summary.get('sell', 0)
         hold_count = summary.get('hold', 0)
 
+        # 変化のない ALL HOLD 通知は省略（本文構築・価格取得・POSTごとスキップ）
+        # 判定・ランキング順・丸めたスコア・通貨別閾値・保有ポジションのいずれかが
+        # 前回送信時から変わっていれば送信する
+        signature = (
+            tuple(sorted(decision_map.items())),
+            tuple((s['pair'], round(s['total_score'], SLACK_SIGNATURE_SCORE_DIGITS))
+                  for s in scored_pairs),
+            tuple(sorted((pair, round(th['buy'], 3), round(th['sell'], 3))
+                         for pair, th in thresholds_map.items())),
+            tuple(sorted(pos.get('pair', '?') for pos in active_positions)),
+        )
+        if (SLACK_SKIP_UNCHANGED_HOLD and buy_count == 0 and sell_count == 0
+                and signature == _last_slack_signature):
+            print("Slack notification skipped (ALL HOLD, unchanged since last post)")
+            return
+
         if buy_count > 0 or sell_count > 0:
             parts = []
             if buy_count > 0:
@@ -1431,32 +1723,25 @@ def notify_slack(result: dict, scored_pairs: list, active_positions: list,
         else:
             header_text = "⚪ マルチTF通貨分析: ALL HOLD"
 
-        # スコアバー
-        def score_bar(score):
-            pos = int((score + 1) * 5)
-            pos = max(0, min(10, pos))
-            return '▓' * pos + '░' * (10 - pos)
-
         # ランキング表示（通貨別判定付き + マルチTFブレークダウン）
-        ranking_text = ""
+        ranking_lines = []
         for i, s in enumerate(scored_pairs):
-            name = TRADING_PAIRS.get(s['pair'], {}).get('name', s['pair'])
-            medal = ['🥇', '🥈', '🥉'][i] if i < 3 else f'{i+1}.'
-            weights = s.get('weights', {})
+            name = PAIR_NAMES.get(s['pair'], s['pair'])
+            medal = _MEDALS[i] if i < 3 else f'{i+1}.'
 
             # 通貨別判定表示
             pair_signal = decision_map.get(s['pair'], 'HOLD')
-            signal_emoji = {'BUY': '🟢BUY', 'SELL': '🔴SELL', 'HOLD': '⚪HOLD'}.get(pair_signal, '⚪HOLD')
+            signal_emoji = _SIGNAL_LABELS.get(pair_signal, '⚪HOLD')
 
             # 通貨別閾値
-            pair_th = thresholds_map.get(s['pair'], {'buy': BASE_BUY_THRESHOLD, 'sell': BASE_SELL_THRESHOLD})
+            pair_th = thresholds_map.get(s['pair'], _DEFAULT_THRESHOLDS)
 
             # マルチTFブレークダウン
             tf_breakdown = s.get('tf_breakdown', {})
             alignment = s.get('alignment', 'unknown')
-            align_emoji = {'aligned': '✅', 'conflicting': '⚠️', 'mixed': '➖'}.get(alignment, '❓')
+            align_emoji = _ALIGNMENT_ICONS.get(alignment, '❓')
 
-            ranking_text += (
+            ranking_lines.append(
                 f"{medal} *{name}*: `{s['total_score']:+.4f}` {score_bar(s['total_score'])} → {signal_emoji}\n"
                 f"    Tech: `{s['components']['technical']:+.3f}` | "
                 f"AI: `{s['components']['chronos']:+.3f}` | "
@@ -1467,43 +1752,39 @@ def notify_slack(result: dict, scored_pairs: list, active_positions: list,
             # TFブレークダウン表示（per-TF シグナル込み）
             if tf_breakdown:
                 tf_parts = []
-                for tf in ['15m', '1h', '4h', '1d']:
+                for tf in ACTIVE_TIMEFRAMES:
                     if tf in tf_breakdown:
                         tf_data = tf_breakdown[tf]
                         tf_sig = tf_data.get('signal', 'HOLD')
-                        sig_icon = {'BUY': '🟢', 'SELL': '🔴', 'HOLD': '⚪'}.get(tf_sig, '⚪')
+                        sig_icon = _SIGNAL_ICONS.get(tf_sig, '⚪')
                         tf_parts.append(f"{tf}:`{tf_data['score']:+.3f}`{sig_icon}")
-                ranking_text += f"    TF: {' | '.join(tf_parts)} {align_emoji}{alignment}\n"
+                ranking_lines.append(f"    TF: {' | '.join(tf_parts)} {align_emoji}{alignment}\n")
 
-            ranking_text += f"    閾値: BUY≥`{pair_th['buy']:+.3f}` / SELL≤`{pair_th['sell']:+.3f}`\n"
+            ranking_lines.append(f"    閾値: BUY≥`{pair_th['buy']:+.3f}` / SELL≤`{pair_th['sell']:+.3f}`\n")
+        ranking_text = ''.join(ranking_lines)
 
         # ポジション情報（複数対応 + 含み損益表示）
         position_text = ""
         if active_positions:
             total_unrealized = 0
             position_lines = []
+            # 現在価格をCoincheck APIから取得（JPY建て、通貨間で並行取得）
+            current_prices = _fetch_current_prices(
+                list(dict.fromkeys(pos.get('pair', '?') for pos in active_positions)))
             for pos in active_positions:
                 pos_pair = pos.get('pair', '?')
                 entry_price = float(pos.get('entry_price', 0))
                 amount = float(pos.get('amount', 0))
 
                 # 通貨名を取得
-                pos_name = pos_pair
-                for pair_key, config in TRADING_PAIRS.items():
-                    if config['coincheck'] == pos_pair:
-                        pos_name = config['name']
-                        break
-
-                # 現在価格をCoincheck APIから取得（JPY建て）
-                current_price = 0
-                try:
-                    current_price = get_current_price(pos_pair)
-                except Exception as e:
-                    print(f"Failed to get current price for {pos_pair}: {e}")
+                analysis_pair = COINCHECK_TO_PAIR.get(pos_pair)
+                pos_name = PAIR_NAMES.get(analysis_pair, pos_pair)
+
+                current_price = current_prices.get(pos_pair, 0)
 
                 # 保有時間
                 entry_time = int(pos.get('entry_time', 0))
-                hold_elapsed = int(time.time()) - entry_time if entry_time else 0
+                hold_elapsed = result['timestamp'] - entry_time if entry_time else 0
                 hold_min = hold_elapsed // 60
                 hold_status = f" | 保有{hold_min}分"
 
@@ -1522,15 +1803,15 @@ def notify_slack(result: dict, scored_pairs: list, active_positions: list,
                         f"📍 *{pos_name}* (`{pos_pair}`) 参入: ¥{entry_price:,.0f}{hold_status}"
                     )
 
-            position_text = '\n'.join(position_lines)
             if len(active_positions) > 1:
                 total_emoji = '💰' if total_unrealized >= 0 else '💸'
-                position_text += f"\n{total_emoji} *合計含み損益: `¥{total_unrealized:+,.0f}`*"
+                position_lines.append(f"{total_emoji} *合計含み損益: `¥{total_unrealized:+,.0f}`*")
+            position_text = '\n'.join(position_lines)
         else:
             position_text = "なし"
 
         # マーケットコンテキスト情報
-        mkt_detail = scored_pairs[0].get('market_context_detail', {}) if scored_pairs else {}
+        mkt_detail = scored_pairs[0].get('market_context_detail') if scored_pairs else None
         if mkt_detail:
             fng_val = mkt_detail.get('fng_value', '?')
             fng_cls = mkt_detail.get('fng_classification', '?')
@@ -1545,69 +1826,43 @@ def notify_slack(result: dict, scored_pairs: list, active_positions: list,
         else:
             mkt_text = "データなし（中立扱い）"
 
+        # F&G補正の有無（閾値が基準の1.3倍超の通貨があるか）
+        has_fng_adjustment = any(th['buy'] > BASE_BUY_THRESHOLD * 1.3 for th in thresholds_map.values())
+
         blocks = [
-            {
-                "type": "header",
-                "text": {
-                    "type": "plain_text",
-                    "text": header_text,
-                    "emoji": True
-                }
-            },
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*🌍 市場環境*\n{mkt_text}"
-                }
-            },
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*📊 通貨ランキング（期待値順）*\n{ranking_text}"
-                }
-            },
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*💼 ポジション ({len(active_positions)}件)*\n{position_text}"
-                }
-            },
-            {
-                "type": "context",
-                "elements": [
-                    {"type": "mrkdwn", "text": f"マルチTF: 15m={TIMEFRAME_WEIGHTS.get('15m', 0):.0%} 1h={TIMEFRAME_WEIGHTS.get('1h', 0):.0%} "
-                                                f"4h={TIMEFRAME_WEIGHTS.get('4h', 0):.0%} 1d={TIMEFRAME_WEIGHTS.get('1d', 0):.0%} | "
-                                                f"基準閾値: BUY≥`{BASE_BUY_THRESHOLD:+.3f}` / SELL≤`{BASE_SELL_THRESHOLD:+.3f}` (ボラ補正あり)"
-                                                + (f" | ⚠️ F&G補正あり" if any(th['buy'] > BASE_BUY_THRESHOLD * 1.3 for th in thresholds_map.values()) else "")}
-                ]
-            }
+            _slack_header(header_text),
+            _slack_section(f"*🌍 市場環境*\n{mkt_text}"),
+            _slack_section(f"*📊 通貨ランキング（期待値順）*\n{ranking_text}"),
+            _slack_section(f"*💼 ポジション ({len(active_positions)}件)*\n{position_text}"),
+            _slack_context(_SLACK_FOOTER_TEXT + (" | ⚠️ F&G補正あり" if has_fng_adjustment else "")),
         ]
 
         if buy_count > 0 or sell_count > 0:
-            action_pairs = [f"{d['signal']} {TRADING_PAIRS.get(d.get('analysis_pair', ''), {}).get('name', d['pair'])}"
-                           for d in (per_currency_decisions or []) if d['signal'] != 'HOLD']
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"⚡ *注文キューに送信済み*: {', '.join(action_pairs)}"
-                }
-            })
+            sent_pairs = []
+            failed_pairs = []
+            for d in (per_currency_decisions or []):
+                if d['signal'] == 'HOLD':
+                    continue
+                analysis_pair = d.get('analysis_pair', '')
+                label = f"{d['signal']} {PAIR_NAMES.get(analysis_pair, d['pair'])}"
+                if saved_pairs is None or analysis_pair in saved_pairs:
+                    sent_pairs.append(label)
+                else:
+                    failed_pairs.append(label)
+            if sent_pairs:
+                blocks.append(_slack_section(f"⚡ *注文キューに送信済み*: {', '.join(sent_pairs)}"))
+            if failed_pairs:
+                blocks.append(_slack_section(f"⚠️ *シグナル保存に失敗（未送信）*: {', '.join(failed_pairs)}"))
 
         message = {"blocks": blocks}
 
-        req = urllib.request.Request(
-            SLACK_WEBHOOK_URL,
-            data=json.dumps(message).encode('utf-8'),
-            headers={'Content-Type': 'application/json'}
-        )
-        response = urllib.request.urlopen(req, timeout=10)
-        print(f"Slack notification sent (status: {response.status})")
+        status = post_json(SLACK_WEBHOOK_URL, message, timeout=10)
+        if status >= 400:
+            print(f"Slack notification failed (status: {status})")
+        else:
+            _last_slack_signature = signature
+            print(f"Slack notification sent (status: {status})")
 
     except Exception as e:
         print(f"Slack notification failed: {e}")
-        import traceback
         traceback.print_exc()
@@ -22,7 +22,7 @@ import traceback
 from botocore.exceptions import ClientError
 from botocore.config import Config
 from trading_common import (
-    PRICES_TABLE, TIMEFRAME_CONFIG, make_pair_tf_key, dynamodb
+    PRICES_TABLE, TIMEFRAME_CONFIG, make_pair_tf_key, projection, dynamodb
 )
 
 # SageMaker用のリトライ設定を修正（無効なパラメータを削除）
@@ -35,10 +35,12 @@ sagemaker_config = Config(
     connect_timeout=10
 )
 
-dynamodb = boto3.resource('dynamodb')
 sagemaker_runtime = boto3.client('sagemaker-runtime', config=sagemaker_config)
 sagemaker_client = boto3.client('sagemaker', config=sagemaker_config)
 
+# DynamoDB Table リソース（ウォームコンテナで使い回すためimport時に1回だけ生成）
+prices_table = dynamodb.Table(PRICES_TABLE)
+
 SAGEMAKER_ENDPOINT = os.environ.get('SAGEMAKER_ENDPOINT', 'eth-trading-chronos-base')
 PREDICTION_LENGTH = int(os.environ.get('PREDICTION_LENGTH', '12'))
 
@@ -185,6 +187,11 @@ def _fallback_response(pair: str, timeframe: str, prices: list, reason: str) ->
     }
 
 
+# Typical Price の算出に使う属性のみ取得（open・volume・ttl 等は転送しない）
+PRICE_HISTORY_ATTRIBUTES = ('price', 'high', 'low')
+_PRICE_HISTORY_PROJECTION, _PRICE_HISTORY_ATTRIBUTE_NAMES = projection(PRICE_HISTORY_ATTRIBUTES)
+
+
 def get_price_history(pair: str, timeframe: str, limit: int = 200) -> list:
     """
     価格履歴取得（pair#timeframe キー対応）
@@ -193,27 +200,29 @@ def get_price_history(pair: str, timeframe: str, limit: int = 200) -> list:
     ローソク足の値動きの重心を使うことで、close のみより豊かな情報を Chronos に提供。
     OHLC がない古いレコードは従来通り close にフォールバック。
     """
-    table = dynamodb.Table(PRICES_TABLE)
     pair_tf_key = make_pair_tf_key(pair, timeframe)
-    response = table.query(
+    response = prices_table.query(
         KeyConditionExpression='pair = :pair',
         ExpressionAttributeValues={':pair': pair_tf_key},
+        ProjectionExpression=_PRICE_HISTORY_PROJECTION,
+        ExpressionAttributeNames=_PRICE_HISTORY_ATTRIBUTE_NAMES,
         ScanIndexForward=False,
         Limit=limit
     )
     items = response.get('Items', [])
 
-    prices = []
-    for item in reversed(items):
+    # 新しい順で返るため、末尾から詰めて古い順に並べる
+    n = len(items)
+    prices = [0.0] * n
+    for k, item in enumerate(items):
         high = item.get('high')
         low = item.get('low')
         close = float(item['price'])
 
         if high is not None and low is not None:
-            typical = (float(high) + float(low) + close) / 3
-            prices.append(typical)
+            prices[n - 1 - k] = (float(high) + float(low) + close) / 3
         else:
-            prices.append(close)
+            prices[n - 1 - k] = close
 
     return prices
 
@@ -335,25 +344,24 @@ def predictions_to_score(result: dict, current_price: float, score_scale_percent
     if not median or current_price <= 0:
         return 0.0
 
-    n = len(median)
-
-    # 外れ値カット: 予測値が異常に大きい/小さい場合を除去
-    valid_predictions = []
-    for p in median:
-        change_pct = abs(p - current_price) / current_price * 100
-        if change_pct < 20:  # ±20%以上の予測は除外
-            valid_predictions.append(p)
+    n_valid = len(median)
+    half = n_valid // 2
+
+    # 外れ値カット・加重和・前後半の合計を1パスで集計
+    # 加重平均は後のステップほど重要 (重み i+1、総和 n(n+1)/2)
+    outlier_limit = current_price * 0.2
+    weighted_sum = 0.0
+    first_half_sum = 0.0
+    second_half_sum = 0.0
+    for i, p in enumerate(median):
+        if abs(p - current_price) >= outlier_limit:  # ±20%以上の予測は現在価格で置換
+            p = current_price
+        weighted_sum += p * (i + 1)
+        if i < half:
+            first_half_sum += p
         else:
-            valid_predictions.append(current_price)  # 現在価格で置換
-
-    if not valid_predictions:
-        return 0.0
-
-    # 加重平均 (後のステップほど重要)
-    n_valid = len(valid_predictions)
-    weights = [(i + 1) / n_valid for i in range(n_valid)]
-    total_weight = sum(weights)
-    weighted_avg = sum(p * w for p, w in zip(valid_predictions, weights)) / total_weight
+            second_half_sum += p
+    weighted_avg = weighted_sum / (n_valid * (n_valid + 1) / 2)
 
     # 変化率 → スコア
     change_percent = (weighted_avg - current_price) / current_price * 100
@@ -363,8 +371,8 @@ def predictions_to_score(result: dict, current_price: float, score_scale_percent
 
     # トレンド加速ボーナス: 後半の予測が前半より強い方向に動いている場合
     if n_valid >= 6:
-        first_half_avg = sum(valid_predictions[:n_valid // 2]) / (n_valid // 2)
-        second_half_avg = sum(valid_predictions[n_valid // 2:]) / (n_valid - n_valid // 2)
+        first_half_avg = first_half_sum / half
+        second_half_avg = second_half_sum / (n_valid - half)
         trend_acceleration = (second_half_avg - first_half_avg) / current_price * 100
         # 加速分をスコアに微加算 (最大±0.15)
         accel_bonus = max(-0.15, min(0.15, trend_acceleration / score_scale_percent * 0.3))